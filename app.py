@@ -4,10 +4,20 @@ import json
 from typing import List, Dict
 import time
 import os
-import google.generativeai as genai
 
-# Configure Gemini using the secret API key
-genai.configure(api_key=st.secrets["google"]["api_key"])
+
+BACKEND_URL = "http://127.0.0.1:8000"
+
+
+@st.cache_resource
+def get_http_client() -> httpx.Client:
+    """One pooled client per Streamlit server process, reused across reruns and sessions"""
+    return httpx.Client(
+        base_url=BACKEND_URL,
+        limits=httpx.Limits(max_keepalive_connections=8),
+        # Fail fast if the backend is unreachable, but allow long model generations
+        timeout=httpx.Timeout(connect=3.0, read=120.0, write=10.0, pool=2.0)
+    )
 
 
 st.set_page_config(
@@ -43,6 +53,8 @@ if "session_id" not in st.session_state:
     st.session_state.session_id = None
 if "documents" not in st.session_state:
     st.session_state.documents = []
+if "attached" not in st.session_state:
+    st.session_state.attached = None  # (session_id, file name, file size) of the session's current document
 
 # -------------------------------
 # Document upload section in sidebar
@@ -69,9 +81,16 @@ with st.sidebar:
 
     # Add a button to clear the conversation
     if st.button("Clear Conversation"):
+        # Free the backend's copy of the session too; a failure here only means it expires later
+        if st.session_state.session_id:
+            try:
+                get_http_client().delete(f"/session/{st.session_state.session_id}")
+            except httpx.HTTPError:
+                pass
         st.session_state.messages = []
         st.session_state.session_id = None
         st.session_state.documents = []
+        st.session_state.attached = None
         st.experimental_rerun()
 
 # -------------------------------
@@ -91,11 +110,12 @@ if st.button("Run Analysis"):
     else:
         with st.spinner("Generating analysis and report..."):
             try:
-                files = {"file": (uploaded_file.name, uploaded_file.getvalue(), uploaded_file.type)}
-                response = httpx.post(
-                    "http://127.0.0.1:8000/generate_report",
-                    files=files,
-                    timeout=120.0
+                # Hand httpx the file object so the multipart body is streamed in chunks
+                uploaded_file.seek(0)
+                files = {"file": (uploaded_file.name, uploaded_file, uploaded_file.type)}
+                response = get_http_client().post(
+                    "/generate_report",
+                    files=files
                 )
                 if response.status_code == 200:
                     pdf_bytes = response.content
@@ -125,54 +145,51 @@ if st.button("Run Analysis"):
 st.header("Chat with the AI")
 
 # Function to handle regular chat
-def process_chat(prompt):
+def stream_chat(prompt):
+    """Yield the assistant reply chunk by chunk as the backend streams it"""
     try:
-        with st.spinner("Thinking..."):
-            # Check if the user included the suggested instruction (optional enhancement)
-            # You could potentially remove the instruction here before sending to backend if desired
-            # if prompt.startswith("Analyze this document thoroughly as a financial expert..."):
-            #     prompt = prompt.replace("Analyze this document thoroughly...", "") # Example removal
-
-            response = httpx.post(
-                "http://127.0.0.1:8000/chat",
-                json={
-                    "messages": [{"role": "user", "content": prompt}],
-                    "session_id": st.session_state.session_id
-                },
-                timeout=60.0
-            )
-            if response.status_code == 200:
-                data = response.json()
-                st.session_state.session_id = data["session_id"]
-                return data["response"]
-            else:
+        with get_http_client().stream(
+            "POST",
+            "/chat/stream",
+            json={
+                "messages": [{"role": "user", "content": prompt}],
+                "session_id": st.session_state.session_id
+            }
+        ) as response:
+            if response.status_code != 200:
+                response.read()
                 st.error(f"Error: {response.text}")
-                return f"Error communicating with backend: {response.status_code}"
+                yield f"Error communicating with backend: {response.status_code}"
+                return
+            st.session_state.session_id = response.headers["X-Session-Id"]
+            yield from response.iter_text()
     except Exception as e:
         st.error(f"Error: {str(e)}")
-        return f"Error: {str(e)}"
+        yield f"Error: {str(e)}"
 
 # Function to handle document upload and chat
 def process_document_chat(file, prompt):
     try:
         with st.spinner("Processing document and analyzing..."):
-            files = {"file": (file.name, file.getvalue(), file.type)} # Use file.type for more specific mime if available
+            # Hand httpx the file object so the multipart body is streamed in chunks
+            file.seek(0)
+            files = {"file": (file.name, file, file.type)} # Use file.type for more specific mime if available
             form_data = {
                 "prompt": prompt,
                 "session_id": st.session_state.session_id if st.session_state.session_id else "",
             }
-            response = httpx.post(
-                "http://127.0.0.1:8000/upload_document",
+            response = get_http_client().post(
+                "/upload_document",
                 files=files,
-                data=form_data,
-                timeout=120.0
+                data=form_data
             )
             if response.status_code == 200:
                 data = response.json()
                 st.session_state.session_id = data["session_id"]
+                # The backend keeps only the latest document per session
+                st.session_state.attached = (data["session_id"], file.name, file.size)
                 if file.name not in st.session_state.documents:
                     st.session_state.documents.append(file.name)
-                    st.experimental_rerun() # Rerun to update sidebar list immediately
                 return data["response"]
             else:
                 st.error(f"Error: {response.text}")
@@ -214,25 +231,27 @@ if prompt:
         st.markdown(prompt)
 
     # Determine if a file needs processing with this prompt
-    # This logic assumes the first message after an upload should process the doc
+    # While the selected file is the session's current document, follow-ups go
+    # through /chat, which already prepends it; any other file is uploaded again
     process_with_doc = False
-    if uploaded_file and uploaded_file.name not in st.session_state.documents:
+    if uploaded_file and (st.session_state.session_id, uploaded_file.name, uploaded_file.size) != st.session_state.attached:
          process_with_doc = True
 
     # Call the appropriate backend function
     if process_with_doc:
+         is_new_document = uploaded_file.name not in st.session_state.documents
          with st.chat_message("assistant"):
             response_text = process_document_chat(uploaded_file, prompt)
             st.markdown(response_text)
             # Add assistant response to chat history
             st.session_state.messages.append({"role": "assistant", "content": response_text})
-         # Rerun to update the sidebar list *after* processing is done
-         st.experimental_rerun()
+         # Rerun once to update the sidebar list, only if it actually changed
+         if is_new_document and uploaded_file.name in st.session_state.documents:
+             st.experimental_rerun()
     else:
         # Just process regular chat
         with st.chat_message("assistant"):
-            response_text = process_chat(prompt)
-            st.markdown(response_text)
+            response_text = st.write_stream(stream_chat(prompt))
             # Add assistant response to chat history
             st.session_state.messages.append({"role": "assistant", "content": response_text})
 
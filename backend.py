@@ -1,28 +1,37 @@
 from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Body
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
 from google import genai
 from google.genai import types
 from dotenv import load_dotenv
 import os
-from typing import List, Optional, Dict, Any
+from typing import Optional
 import uuid
-from pathlib import Path
+import asyncio
+import io
 import logging
-import tempfile
-import json
-import re
-from fastapi.responses import FileResponse
+import orjson
+import hashlib
+from datetime import datetime, timezone
+from pathlib import Path
+from collections import OrderedDict, deque
+from functools import lru_cache
+from cachetools import TTLCache
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
+from starlette.concurrency import iterate_in_threadpool
 from report_generator import generate_pdf_report
-from prompts import EXTRACTION_PROMPT
-import pandas as pd
+from prompts import REPORT_PROMPT
+from schemas import ChatRequest, ChatResponse, ReportPayload
+import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import redis.asyncio as redis
 
 load_dotenv()
 
 # Configure the Gemini API using the newer library's client
 client = genai.Client(api_key=os.getenv("GOOGLE_API_KEY"))
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -32,30 +41,225 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-UPLOAD_DIR = Path("temp_uploads")
-UPLOAD_DIR.mkdir(exist_ok=True)
+# Enhanced session storage that tracks documents and message history.
+# With REDIS_URL set, sessions live in Redis so any worker can serve them;
+# otherwise they are kept in this per-process cache, which drops sessions idle
+# for longer than an hour and caps how many are held at once. Each entry is a
+# dict with the chat object, a deque of the most recent messages, the list of
+# Gemini file references and the context cache holding the document, if any.
+# It is only touched from the event loop thread, so it needs no lock.
+sessions = TTLCache(maxsize=10_000, ttl=3600)
+
+# REDIS_URL may point at a unix socket (unix:///var/run/redis/redis.sock) to
+# skip the TCP stack when Redis runs on the same host; from_url pools connections
+REDIS_URL = os.getenv("REDIS_URL")
+redis_client = redis.Redis.from_url(REDIS_URL, decode_responses=True) if REDIS_URL else None
+SESSION_TTL_SECONDS = 86400
+
+CHAT_MODEL = 'gemini-2.0-flash'
+# The report needs structured output (response_schema), which the thinking model does not support
+REPORT_MODEL = 'gemini-2.0-flash'
+
+# Session documents are put in a Gemini context cache so follow-up turns do not
+# re-send and re-tokenize them; the TTL is extended whenever a turn finds it
+# within CONTEXT_CACHE_REFRESH_SECONDS of expiring
+CONTEXT_CACHE_TTL_SECONDS = 3600
+CONTEXT_CACHE_REFRESH_SECONDS = 600
+
+# Only the last HISTORY_TURNS exchanges are kept verbatim; once the Gemini chat
+# has grown SUMMARIZE_EVERY turns past that window, the older turns are folded
+# into a single summary so each request re-sends a bounded amount of context
+HISTORY_TURNS = 10
+SUMMARIZE_EVERY = 20
+# The report prompt and schema never change, so the prompt part and request
+# config are built once instead of on every /generate_report call
+REPORT_PROMPT_PART = types.Part.from_text(text=REPORT_PROMPT)
+REPORT_CONFIG = types.GenerateContentConfig(
+    response_mime_type='application/json',
+    response_schema=ReportPayload
+)
+
+SUMMARY_PROMPT = """Summarize the following conversation between a user and a financial analysis assistant.
+Keep every figure, company name, document reference and conclusion that later questions may rely on.
+
+"""
+
+# Upload MIME types by lowercased file extension
+MIME_BY_EXT = {
+    ".pdf": "application/pdf",
+    ".csv": "text/csv",
+    ".xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    ".xls": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
 
-# Enhanced session storage that tracks documents and message history
-chat_sessions = {}  # session_id -> chat object
-session_documents = {}  # session_id -> list of document parts
-session_history = {}  # session_id -> list of messages
+# Cached file references this close to their Files API expiry are uploaded again
+# rather than reused, so a session never starts on a file about to be purged
+FILE_EXPIRY_MARGIN_SECONDS = 6 * 3600
+
+# Uploads are read in chunks of this size when fingerprinting
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+# Process-wide LRU of (Gemini file reference, context cache) keyed by
+# (sha256 of content, MIME type), so re-uploading the same file skips the
+# Files API round-trip and shares the cached document tokens
+DOCUMENT_CACHE_SIZE = 64
+document_cache = OrderedDict()
 
 logging.basicConfig(level=logging.INFO)
 
 
-class ChatMessage(BaseModel):
-    role: str
-    content: str
+def mime_type_for(filename):
+    """Return the upload MIME type for a file name, defaulting to PDF."""
+    return MIME_BY_EXT.get(Path(filename).suffix.lower(), "application/pdf")
+
 
+def create_chat(history=None, context_cache=None):
+    """Start a Gemini chat that reads the session document from its context cache, if there is one."""
+    config = types.GenerateContentConfig(cached_content=context_cache.name) if context_cache else None
+    return client.chats.create(model=CHAT_MODEL, config=config, history=history or [])
 
-class ChatRequest(BaseModel):
-    messages: List[ChatMessage]
-    session_id: Optional[str] = None
 
+def file_is_expiring(document_file):
+    """Whether the Files API will purge an uploaded file (48 hours after upload) within FILE_EXPIRY_MARGIN_SECONDS."""
+    if document_file.expiration_time is None:
+        return False
+    remaining = (document_file.expiration_time - datetime.now(timezone.utc)).total_seconds()
+    return remaining < FILE_EXPIRY_MARGIN_SECONDS
 
-class ChatResponse(BaseModel):
-    response: str
-    session_id: str
+
+def create_context_cache(document_file):
+    """Cache an uploaded document server-side, or return None if Gemini will not cache it (e.g. too few tokens)."""
+    try:
+        context_cache = client.caches.create(
+            model=CHAT_MODEL,
+            config=types.CreateCachedContentConfig(
+                contents=[types.Content(role='user', parts=[
+                    types.Part.from_uri(file_uri=document_file.uri, mime_type=document_file.mime_type)
+                ])],
+                ttl=f"{CONTEXT_CACHE_TTL_SECONDS}s"
+            )
+        )
+    except Exception as e:
+        logging.info(f"Not caching {document_file.name}, it will be attached to each turn instead: {e}")
+        return None
+    logging.info(f"Cached {document_file.name} as {context_cache.name}")
+    return context_cache
+
+
+def refresh_context_cache(context_cache):
+    """Extend a context cache that is about to expire; return None once it has expired."""
+    if context_cache.expire_time is None:
+        return context_cache
+    remaining = (context_cache.expire_time - datetime.now(timezone.utc)).total_seconds()
+    if remaining <= 0:
+        return None
+    if remaining < CONTEXT_CACHE_REFRESH_SECONDS:
+        return client.caches.update(
+            name=context_cache.name,
+            config=types.UpdateCachedContentConfig(ttl=f"{CONTEXT_CACHE_TTL_SECONDS}s")
+        )
+    return context_cache
+
+
+def prepare_turn(chat_session, documents, context_cache, text):
+    """Return (chat, context_cache, message) for a follow-up turn on a session."""
+    if context_cache is not None:
+        context_cache = refresh_context_cache(context_cache)
+        if context_cache is not None:
+            return chat_session, context_cache, text
+        # The cache expired, so carry on with the document attached to each turn
+        chat_session = create_chat(chat_session.get_history(curated=True))
+    
+    if not documents:
+        # Just a text message, no documents
+        return chat_session, None, text
+    return chat_session, None, [*documents, types.Part.from_text(text=text)]
+
+
+async def load_session(session_id):
+    """Return (chat, documents, context_cache) for a session, starting an empty one if unknown."""
+    if redis_client is None:
+        session = sessions.get(session_id)
+        if session is None:
+            session = sessions[session_id] = {
+                "chat": create_chat(),
+                "history": deque(maxlen=2 * HISTORY_TURNS),
+                "documents": [],
+                "context_cache": None,
+            }
+        return session["chat"], session["documents"], session["context_cache"]
+    
+    # Redis holds only the serialized chat turns and the file and cache
+    # references; the chat object itself is rebuilt for every request
+    meta = await redis_client.hgetall(f"session:{session_id}:meta")
+    context_cache = orjson.loads(meta.get("context_cache", "null"))
+    context_cache = types.CachedContent.model_validate(context_cache) if context_cache else None
+    chat_session = create_chat(
+        [types.Content.model_validate(content) for content in orjson.loads(meta.get("chat", "[]"))],
+        context_cache
+    )
+    documents = [types.File.model_validate(document) for document in orjson.loads(meta.get("documents", "[]"))]
+    return chat_session, documents, context_cache
+
+
+async def save_session(session_id, chat_session, documents, context_cache, turn):
+    """Persist a session after a turn, appending the turn's messages to its display history."""
+    if redis_client is None:
+        # The session may have expired while the turn was in flight
+        session = sessions.get(session_id) or {"history": deque(maxlen=2 * HISTORY_TURNS)}
+        session["history"].extend(turn)
+        session.update(chat=chat_session, documents=documents, context_cache=context_cache)
+        sessions[session_id] = session  # re-inserting restarts the idle timeout
+        return
+    
+    meta_key, history_key = f"session:{session_id}:meta", f"session:{session_id}:history"
+    async with redis_client.pipeline(transaction=True) as pipe:
+        pipe.hset(meta_key, mapping={
+            "chat": orjson.dumps([content.model_dump(mode='json', exclude_none=True) for content in chat_session.get_history(curated=True)]),
+            "documents": orjson.dumps([document.model_dump(mode='json', exclude_none=True) for document in documents]),
+            "context_cache": orjson.dumps(context_cache.model_dump(mode='json', exclude_none=True) if context_cache else None),
+        })
+        pipe.rpush(history_key, *(orjson.dumps(message) for message in turn))
+        pipe.ltrim(history_key, -2 * HISTORY_TURNS, -1)
+        pipe.expire(meta_key, SESSION_TTL_SECONDS)
+        pipe.expire(history_key, SESSION_TTL_SECONDS)
+        await pipe.execute()
+
+
+@lru_cache(maxsize=None)
+def get_langchain_handler():
+    """Build the LangChain handler, with its Gemini LLM clients and chains, once per process."""
+    from langchain_integration import LangChainHandler
+    return LangChainHandler()
+
+
+def compact_chat(chat_session, context_cache=None):
+    """Return a chat whose turns older than the history window are replaced by a one-off summary."""
+    history = chat_session.get_history(curated=True)
+    if len(history) < 2 * (HISTORY_TURNS + SUMMARIZE_EVERY):
+        return chat_session
+    
+    older, recent = history[:-2 * HISTORY_TURNS], history[-2 * HISTORY_TURNS:]
+    transcript = "\n".join(
+        f"{content.role}: {part.text}"
+        for content in older
+        for part in content.parts or []
+        if part.text
+    )
+    summary = client.models.generate_content(
+        model=CHAT_MODEL,
+        contents=SUMMARY_PROMPT + transcript
+    ).text
+    logging.info(f"Compacted {len(older)} chat messages into a summary")
+    
+    return create_chat(
+        [
+            types.Content(role='user', parts=[types.Part.from_text(text=f"Summary of our earlier conversation:\n{summary}")]),
+            types.Content(role='model', parts=[types.Part.from_text(text="Understood, I will keep this context in mind.")]),
+            *recent
+        ],
+        context_cache
+    )
 
 
 @app.post("/chat", response_model=ChatResponse)
@@ -63,36 +267,24 @@ async def chat(request: ChatRequest):
     try:
         session_id = request.session_id or str(uuid.uuid4())
         
-        # Initialize chat session if needed
-        if session_id not in chat_sessions:
-            chat_sessions[session_id] = client.chats.create(model='gemini-2.0-flash')
-            session_history[session_id] = []
-            session_documents[session_id] = []
-        
-        chat_session = chat_sessions[session_id]
+        # Load the chat session, starting a new one if needed
+        chat_session, documents, context_cache = await load_session(session_id)
         user_message_content = request.messages[-1].content if request.messages else ""
         
-        # Prepare message parts: first any documents in context, then the new message
-        message_parts = []
-        
-        # Add any documents associated with this session
-        if session_documents.get(session_id):
-            message_parts.extend(session_documents[session_id])
-        
-        # Add the user's text message
-        message_parts.append(types.Part.from_text(text=user_message_content))
-        
-        # Send the message with all context
-        if len(message_parts) == 1:
-            # Just a text message, no documents
-            response = chat_session.send_message(user_message_content)
-        else:
-            # Message with document context
-            response = chat_session.send_message(message_parts)
+        # Send the message, with the session document from its context cache
+        # or, failing that, attached ahead of the text
+        chat_session, context_cache, message = await asyncio.to_thread(
+            prepare_turn, chat_session, documents, context_cache, user_message_content
+        )
+        response = await asyncio.to_thread(chat_session.send_message, message)
         
         # Store in history
-        session_history[session_id].append({"role": "user", "content": user_message_content})
-        session_history[session_id].append({"role": "assistant", "content": response.text})
+        turn = [
+            {"role": "user", "content": user_message_content},
+            {"role": "assistant", "content": response.text},
+        ]
+        chat_session = await asyncio.to_thread(compact_chat, chat_session, context_cache)
+        await save_session(session_id, chat_session, documents, context_cache, turn)
         
         return ChatResponse(response=response.text, session_id=session_id)
     
@@ -101,83 +293,163 @@ async def chat(request: ChatRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """Same as /chat, but streams the reply as plain text while Gemini generates it."""
+    session_id = request.session_id or str(uuid.uuid4())
+    chat_session, documents, context_cache = await load_session(session_id)
+    user_message_content = request.messages[-1].content if request.messages else ""
+    chat_session, context_cache, message = await asyncio.to_thread(
+        prepare_turn, chat_session, documents, context_cache, user_message_content
+    )
+    
+    async def stream_reply():
+        nonlocal chat_session
+        reply = []
+        try:
+            async for chunk in iterate_in_threadpool(chat_session.send_message_stream(message)):
+                if chunk.text:
+                    reply.append(chunk.text)
+                    yield chunk.text
+        except Exception as e:
+            # Headers are already sent, so report the failure inside the stream
+            logging.exception("Error in /chat/stream endpoint:")
+            yield f"\n\nError: {str(e)}"
+            return
+        
+        # Store in history once the full reply is known
+        turn = [
+            {"role": "user", "content": user_message_content},
+            {"role": "assistant", "content": "".join(reply)},
+        ]
+        chat_session = await asyncio.to_thread(compact_chat, chat_session, context_cache)
+        await save_session(session_id, chat_session, documents, context_cache, turn)
+    
+    return StreamingResponse(
+        stream_reply(),
+        media_type="text/plain; charset=utf-8",
+        headers={"X-Session-Id": session_id}
+    )
+
+
 @app.post("/upload_document", response_model=ChatResponse)
 async def upload_document(
     file: UploadFile = File(...),
     prompt: str = Form(...),
     session_id: Optional[str] = Form(None)
 ):
-    file_path = None
     try:
         session_id = session_id or str(uuid.uuid4())
         
-        # Save uploaded file
-        file_path = UPLOAD_DIR / f"{uuid.uuid4()}_{file.filename}"
-        with open(file_path, "wb") as f:
-            content = await file.read()
-            f.write(content)
-        logging.info(f"File saved to {file_path} ({len(content)} bytes)")
-        
-        # Determine MIME type
-        mime_type = "application/pdf"  # default
-        if file.filename.lower().endswith(".csv"):
-            mime_type = "text/csv"
-        elif file.filename.lower().endswith((".xlsx", ".xls")):
-            mime_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        # Fingerprint the upload chunk by chunk straight from Starlette's spooled
+        # file, so large documents are never held in memory as one bytes object
+        digest = hashlib.sha256()
+        size = 0
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            digest.update(chunk)
+            size += len(chunk)
+        await file.seek(0)
+        content_hash = digest.hexdigest()
+        logging.info(f"Received {file.filename} ({size} bytes, sha256={content_hash[:12]})")
+        
+        mime_type = mime_type_for(file.filename)
         logging.info(f"Using MIME type: {mime_type} for {file.filename}")
         
-        # Read file data
-        with open(file_path, "rb") as f:
-            file_data = f.read()
-        
-        # Create document part
-        document_part = types.Part.from_bytes(
-            data=file_data,
-            mime_type=mime_type
-        )
-        
-        # Initialize chat session if needed
-        if session_id not in chat_sessions:
-            chat_sessions[session_id] = client.chats.create(model='gemini-2.0-flash')
-            session_history[session_id] = []
-            session_documents[session_id] = []
-        
-        # Store document for future context
-        session_documents[session_id].append(document_part)
-        
-        # Create the message with document and prompt
-        message_parts = [document_part, types.Part.from_text(text=prompt)]
+        # Reuse the uploaded file and its context cache if the same content was
+        # seen before, otherwise upload it once through the Files API and cache it
+        cache_key = (content_hash, mime_type)
+        cached = document_cache.get(cache_key)
+        if cached is not None and file_is_expiring(cached[0]):
+            logging.info(f"Uploaded file {cached[0].name} is about to be purged, uploading {file.filename} again")
+            cached = None
+        if cached is not None:
+            document_cache.move_to_end(cache_key)
+            document_file, context_cache = cached
+            logging.info(f"Reusing uploaded file {document_file.name} for {file.filename}")
+            if context_cache is not None:
+                context_cache = await asyncio.to_thread(refresh_context_cache, context_cache)
+                if context_cache is None:
+                    context_cache = await asyncio.to_thread(create_context_cache, document_file)
+        else:
+            document_file = await asyncio.to_thread(
+                client.files.upload,
+                file=file.file,
+                config={"mime_type": mime_type, "display_name": file.filename}
+            )
+            logging.info(f"Uploaded {file.filename} as {document_file.name}")
+            context_cache = await asyncio.to_thread(create_context_cache, document_file)
+        document_cache[cache_key] = (document_file, context_cache)
+        if len(document_cache) > DOCUMENT_CACHE_SIZE:
+            document_cache.popitem(last=False)  # evict least recently used
+        
+        # Load the chat session, starting a new one if needed
+        chat_session, documents, session_cache = await load_session(session_id)
+        
+        if any(document.name == document_file.name for document in documents):
+            # The same content is already this session's document, so ask the
+            # question as an ordinary follow-up instead of attaching it again
+            logging.info(f"{file.filename} is already attached to session {session_id}")
+            chat_session, context_cache, message = await asyncio.to_thread(
+                prepare_turn, chat_session, documents, session_cache, prompt
+            )
+        else:
+            # Keep only the latest document as context for follow-up questions
+            documents = [document_file]
+            
+            # Rebind the conversation to this document's context cache (or to none,
+            # replacing any cache of a previous document); an uncached document is
+            # attached to the message instead
+            chat_session = create_chat(chat_session.get_history(curated=True), context_cache)
+            if context_cache is not None:
+                message = prompt
+            else:
+                message = [document_file, types.Part.from_text(text=prompt)]
         
         # Send the message
-        chat_session = chat_sessions[session_id]
-        response = chat_session.send_message(message_parts)
+        response = await asyncio.to_thread(chat_session.send_message, message)
         
         # Store in history
-        session_history[session_id].append({
-            "role": "user", 
-            "content": f"[Uploaded document: {file.filename}] {prompt}"
-        })
-        session_history[session_id].append({"role": "assistant", "content": response.text})
-        
-        # Clean up file
-        if file_path:
-            file_path.unlink(missing_ok=True)
+        turn = [
+            {"role": "user", "content": f"[Uploaded document: {file.filename}] {prompt}"},
+            {"role": "assistant", "content": response.text},
+        ]
+        chat_session = await asyncio.to_thread(compact_chat, chat_session, context_cache)
+        await save_session(session_id, chat_session, documents, context_cache, turn)
         
         return ChatResponse(response=response.text, session_id=session_id)
     
     except Exception as e:
-        if file_path:
-            file_path.unlink(missing_ok=True)
         logging.exception("Error in upload_document endpoint:")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/session/{session_id}/history")
 async def get_session_history(session_id: str):
-    if session_id not in session_history:
+    if redis_client is not None:
+        if not await redis_client.exists(f"session:{session_id}:meta"):
+            raise HTTPException(status_code=404, detail="Session not found")
+        stored = await redis_client.lrange(f"session:{session_id}:history", 0, -1)
+        return {"session_id": session_id, "history": [orjson.loads(message) for message in stored]}
+    
+    session = sessions.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    
+    return {"session_id": session_id, "history": list(session["history"])}
+
+
+@app.delete("/session/{session_id}")
+async def delete_session(session_id: str):
+    if redis_client is not None:
+        removed = await redis_client.unlink(f"session:{session_id}:meta", f"session:{session_id}:history")
+        if not removed:
+            raise HTTPException(status_code=404, detail="Session not found")
+        return {"session_id": session_id, "status": "deleted"}
+    
+    if sessions.pop(session_id, None) is None:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    return {"session_id": session_id, "history": session_history[session_id]}
+    return {"session_id": session_id, "status": "deleted"}
 
 
 @app.get("/health")
@@ -191,80 +463,49 @@ async def generate_report(file: UploadFile = File(...)):
     Endpoint to analyze a financial document and generate a PDF report.
     Directly uses the uploaded PDF file with Gemini's vision capabilities.
     """
-    file_path = None
     try:
-        # Save uploaded file temporarily
-        file_path = UPLOAD_DIR / f"{uuid.uuid4()}_{file.filename}"
-        with open(file_path, "wb") as f:
-            content = await file.read()
-            f.write(content)
-        logging.info(f"File saved to {file_path} ({len(content)} bytes)")
-        
-        # Determine MIME type
-        mime_type = "application/pdf"  # default
-        if file.filename.lower().endswith(".csv"):
-            mime_type = "text/csv"
-        elif file.filename.lower().endswith((".xlsx", ".xls")):
-            mime_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        
-        # Create a temporary chat session for analysis
-        analysis_session = client.chats.create(model='gemini-2.0-flash-thinking-exp-01-21')
+        # Keep the upload in memory; it is handed to Gemini as-is
+        content = await file.read()
+        logging.info(f"Received {file.filename} ({len(content)} bytes)")
         
-        # Read file data
-        with open(file_path, "rb") as f:
-            file_data = f.read()
+        mime_type = mime_type_for(file.filename)
         
         # Create document part
         document_part = types.Part.from_bytes(
-            data=file_data,
+            data=content,
             mime_type=mime_type
         )
         
-        # Use EXTRACTION_PROMPT from prompts.py instead of inline text
-        extraction_prompt = EXTRACTION_PROMPT
-        # Send the extraction request with document context
-        message_parts = [document_part, types.Part.from_text(text=extraction_prompt)]
-        extraction_response = analysis_session.send_message(message_parts)
-        
-        # Process the JSON response
-        json_text = extraction_response.text
-        try:
-            # First try direct JSON parsing
-            extracted_data = json.loads(json_text)
-        except json.JSONDecodeError:
-            # If that fails, try to extract JSON from code blocks
-            json_match = re.search(r'```json\s*(.*?)\s*```', json_text, re.DOTALL)
-            if json_match:
-                extracted_data = json.loads(json_match.group(1))
-            else:
-                # One more attempt without code block markers
-                json_match = re.search(r'({[\s\S]*})', json_text)
-                if json_match:
-                    extracted_data = json.loads(json_match.group(1))
-                else:
-                    raise ValueError("Failed to extract valid JSON from LLM response")
+        # One schema-constrained call returns both the extracted data and the
+        # business overview, so the document is only sent and prefilled once
+        report_response = await asyncio.to_thread(
+            client.models.generate_content,
+            model=REPORT_MODEL,
+            contents=[document_part, REPORT_PROMPT_PART],
+            config=REPORT_CONFIG
+        )
+        payload = report_response.parsed or ReportPayload.model_validate_json(report_response.text)
+        extracted_data = payload.extracted_data.model_dump()
+        business_overview = payload.business_overview
         
         # Calculate financial ratios
-        from langchain_integration import LangChainHandler
-        handler = LangChainHandler()
+        handler = get_langchain_handler()
         calculated_ratios = handler.calculate_financial_ratios(extracted_data)
         
-        # Add red flags detection
-        red_flags_detection = handler.detect_financial_red_flags(extracted_data, calculated_ratios)
-        
-        # Generate key findings, sentiment analysis, and business model recommendations
+        # Run the rule-based red flag checks alongside the LLM calls for key findings,
+        # sentiment analysis, and business model recommendations
         logging.info("Generating key findings, sentiment analysis, and business model recommendations...")
-        key_findings_json = handler.generate_key_findings(extracted_data, calculated_ratios)
-        
-        # Generate business overview
-        logging.info("Generating business overview...")
-        business_overview = handler.generate_business_overview(extracted_data)
+        red_flags_detection, key_findings_json = await asyncio.gather(
+            asyncio.to_thread(handler.detect_financial_red_flags, extracted_data, calculated_ratios),
+            handler.agenerate_key_findings(extracted_data, calculated_ratios)
+        )
         
-        # Log what we received from the handler
-        logging.info(f"Business overview: {business_overview[:100]}...")
-        logging.info(f"Key findings: {key_findings_json.get('key_findings', '')[:100]}...")
-        logging.info(f"Sentiment analysis: {key_findings_json.get('sentiment_analysis', '')[:100]}...")
-        logging.info(f"Business model: {key_findings_json.get('business_model', '')[:100]}...")
+        # Log what we received from the handler; the %.100s formatting (and truncation)
+        # only happens if INFO is enabled
+        logging.info("Business overview: %.100s...", business_overview)
+        logging.info("Key findings: %.100s...", key_findings_json.get('key_findings', ''))
+        logging.info("Sentiment analysis: %.100s...", key_findings_json.get('sentiment_analysis', ''))
+        logging.info("Business model: %.100s...", key_findings_json.get('business_model', ''))
                 
         # Merge the separately detected red flags with the ones returned from the findings prompt,
         # if necessary – here we give priority to key_findings' red_flags.
@@ -280,25 +521,101 @@ async def generate_report(file: UploadFile = File(...)):
 
         logging.info("Preparing to generate PDF report with all data...")
         
-        # Generate PDF report in a temporary file
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-            output_path = tmp.name
-        
-        generate_pdf_report(report_data, output_path)
-        logging.info(f"PDF report generated successfully at {output_path}")
+        # Generate the PDF report in memory so no temporary file is left behind
+        pdf_buffer = io.BytesIO()
+        generate_pdf_report(report_data, pdf_buffer)
+        logging.info(f"PDF report generated successfully ({pdf_buffer.getbuffer().nbytes} bytes)")
         
-        # Clean up the temporary file
-        if file_path:
-            file_path.unlink(missing_ok=True)
-        
-        return FileResponse(path=output_path, filename="financial_report.pdf", media_type="application/pdf")
+        return Response(
+            content=pdf_buffer.getvalue(),
+            media_type="application/pdf",
+            headers={"Content-Disposition": 'attachment; filename="financial_report.pdf"'}
+        )
     except Exception as e:
-        # Clean up on error
-        if file_path:
-            file_path.unlink(missing_ok=True)
         logging.exception(f"Error generating report: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# Cell values read as missing in numeric CSV columns
+CSV_NULL_VALUES = ["", "N/A", "n/a", "NA", "#N/A", "NULL", "null", "NaN", "nan", "-"]
+
+
+def csv_numeric_batches(source):
+    """Yield (numeric column names, float64 values, row labels) for each Arrow record batch of a CSV file."""
+    # Arrow infers column types from the first block only, so find the numeric
+    # columns there and then read them as float64 to accept later decimals and
+    # null markers in columns that started out as integers. Year is left as
+    # inferred since it is only used as a label.
+    source.seek(0)
+    names = [field.name for field in pa_csv.open_csv(source).schema
+             if pa.types.is_integer(field.type) or pa.types.is_floating(field.type)]
+    source.seek(0)
+    reader = pa_csv.open_csv(source, convert_options=pa_csv.ConvertOptions(
+        column_types={name: pa.float64() for name in names if name != "Year"},
+        null_values=CSV_NULL_VALUES
+    ))
+    offset = 0
+    for batch in reader:
+        # Nulls become NaN once cast to float64
+        values = np.empty((batch.num_rows, len(names)))
+        for i, name in enumerate(names):
+            values[:, i] = batch.column(name).cast(pa.float64()).to_numpy(zero_copy_only=False)
+        if "Year" in reader.schema.names:
+            labels = batch.column("Year").to_numpy(zero_copy_only=False)
+        else:
+            labels = np.arange(offset, offset + batch.num_rows)
+        offset += batch.num_rows
+        yield names, values, labels
+
+
+def find_anomalies(source, sensitivity):
+    """Flag numeric cells more than sensitivity * 2 standard deviations from their column mean.
+
+    The CSV is read twice, one record batch at a time: the first pass merges
+    per-batch (count, mean, M2) into running column statistics (Welford/Chan),
+    the second compares each cell against them, so memory stays bounded by the
+    batch size rather than the file size.
+    """
+    names, count, mean, m2 = [], 0, 0, 0
+    for names, values, _ in csv_numeric_batches(source):
+        batch_count = np.sum(~np.isnan(values), axis=0)
+        batch_mean = np.divide(np.nansum(values, axis=0), batch_count,
+                               out=np.zeros(len(names)), where=batch_count > 0)
+        batch_m2 = np.nansum((values - batch_mean) ** 2, axis=0)
+        total = count + batch_count
+        delta = batch_mean - mean
+        weight = np.divide(batch_count, total, out=np.zeros(len(names)), where=total > 0)
+        mean = mean + delta * weight
+        m2 = m2 + batch_m2 + delta ** 2 * count * weight
+        count = total
+    if not names:
+        return []
+    # Sample standard deviation, as pandas computes it; NaN with fewer than two values
+    std = np.sqrt(np.divide(m2, count - 1, out=np.full(len(names), np.nan), where=count > 1))
+
+    # Anomalies are grouped column by column
+    by_column = [[] for _ in names]
+    for _, values, labels in csv_numeric_batches(source):
+        deviation = np.abs(values - mean)
+        rows, cols = np.nonzero(deviation > sensitivity * 2 * std)
+        confidence = np.minimum(deviation[rows, cols] / (3 * std[cols]), 1.0)
+        for year, col, value, column_deviation, column_confidence in zip(
+            labels[rows].tolist(),
+            cols.tolist(),
+            values[rows, cols].tolist(),
+            deviation[rows, cols].tolist(),
+            confidence.tolist()
+        ):
+            by_column[col].append({
+                "Year": year,
+                "Column": names[col],
+                "Value": value,
+                "Mean": float(mean[col]),
+                "Deviation": column_deviation,
+                "Confidence": column_confidence
+            })
+    return [anomaly for column in by_column for anomaly in column]
+
+
 @app.post("/detect_anomalies")
 async def detect_anomalies(
     file: UploadFile = File(...),
@@ -308,52 +625,27 @@ async def detect_anomalies(
     Detect anomalies in financial data using statistical methods.
     """
     try:
-        content = await file.read()
-        if not content:
+        if not file.file.read(1):
             raise HTTPException(status_code=400, detail="Empty file")
 
-        # Save content to a temporary file
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".csv").name
-        with open(temp_file, "wb") as f:
-            f.write(content)
-
         try:
-            # Read financial data
-            financial_data = pd.read_csv(temp_file)
-
-            # Basic statistical anomaly detection
-            anomalies = []
-            for column in financial_data.select_dtypes(include=['float64', 'int64']).columns:
-                mean = financial_data[column].mean()
-                std = financial_data[column].std()
-                threshold = sensitivity * 2 * std
-
-                # Find rows where values are beyond threshold
-                outliers = financial_data[abs(financial_data[column] - mean) > threshold]
-
-                for idx, row in outliers.iterrows():
-                    anomalies.append({
-                        "Year": row.get("Year", idx),
-                        "Column": column,
-                        "Value": row[column],
-                        "Mean": mean,
-                        "Deviation": abs(row[column] - mean),
-                        "Confidence": min(abs(row[column] - mean) / (3 * std), 1.0)
-                    })
+            # Scan the spooled upload in Arrow record batches instead of loading it whole
+            anomalies = await asyncio.to_thread(find_anomalies, file.file, sensitivity)
 
             return {
                 "num_anomalies": len(anomalies),
                 "anomalies": anomalies
             }
 
+        except pa.ArrowInvalid as e:
+            # A value past the first block that doesn't fit its column, e.g. text in a numeric column
+            raise HTTPException(status_code=400, detail=f"Invalid CSV data: {e}")
         except Exception as e:
             logging.exception("Error during anomaly detection processing:")
             raise HTTPException(status_code=500, detail=str(e))
 
-        finally:
-            # Clean up temp file
-            os.unlink(temp_file)
-
+    except HTTPException:
+        raise
     except Exception as e:
         logging.exception("Error in detect_anomalies endpoint:")
         raise HTTPException(status_code=500, detail=str(e))
@@ -362,4 +654,9 @@ async def detect_anomalies(
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="127.0.0.1", port=8000)
\ No newline at end of file
+    # Sessions are only shared between workers through Redis, so default to a
+    # single worker without it; loop/http "auto" pick uvloop and httptools when installed
+    workers = int(os.getenv("WEB_CONCURRENCY", os.cpu_count() if redis_client else 1))
+    if workers > 1 and redis_client is None:
+        logging.warning("Running several workers without REDIS_URL; chat sessions will not be shared between them")
+    uvicorn.run("backend:app", host="127.0.0.1", port=8000, workers=workers, loop="auto", http="auto")
\ No newline at end of file
@@ -1,4 +1,5 @@
 # financial_tools.py
+import numpy as np
 
 def calculate_current_ratio(current_assets: float, current_liabilities: float) -> float:
     """Calculates the current ratio."""
@@ -56,4 +57,33 @@ def calculate_debt_ratio(total_liabilities: float, total_assets: float) -> float
 def calculate_interest_coverage_ratio(operating_income: float, interest_expenses: float) -> float:
     if interest_expenses == 0:
         return float('inf')
-    return operating_income / interest_expenses
\ No newline at end of file
+    return operating_income / interest_expenses
+
+# (ratio name, numerator field, denominator field) for every standard ratio,
+# evaluated together by calculate_ratios
+RATIO_SPECS = (
+    ("Current Ratio", "current_assets", "current_liabilities"),
+    ("Cash Ratio", "cash_and_equivalents", "current_liabilities"),
+    ("Debt to Equity Ratio", "total_liabilities", "shareholders_equity"),
+    ("Gross Margin Ratio", "gross_profit", "net_sales"),
+    ("Operating Margin Ratio", "operating_income", "net_sales"),
+    ("Return on Assets Ratio", "net_income", "total_assets"),
+    ("Return on Equity Ratio", "net_income", "shareholders_equity"),
+    ("Asset Turnover Ratio", "net_sales", "average_total_assets"),
+    ("Inventory Turnover Ratio", "cost_of_goods_sold", "average_inventory"),
+    ("Receivables Turnover Ratio", "net_credit_sales", "average_accounts_receivable"),
+    ("Debt Ratio", "total_liabilities", "total_assets"),
+    ("Interest Coverage Ratio", "operating_income", "interest_expenses"),
+)
+
+def calculate_ratios(values: dict) -> np.ndarray:
+    """Calculates every ratio in RATIO_SPECS with a single vectorized division.
+
+    values maps field names to numbers, or to equal-length sequences to evaluate several
+    periods or documents at once. Row i of the result belongs to RATIO_SPECS[i]; missing
+    (None) inputs and zero denominators give NaN.
+    """
+    numerators = np.array([values.get(numerator) for _, numerator, _ in RATIO_SPECS], dtype=np.float64)
+    denominators = np.array([values.get(denominator) for _, _, denominator in RATIO_SPECS], dtype=np.float64)
+    with np.errstate(invalid='ignore'):
+        return np.divide(numerators, denominators, out=np.full_like(numerators, np.nan), where=denominators != 0)
@@ -1,25 +1,214 @@
 from langchain_google_genai import GoogleGenerativeAI
 from langchain.prompts import ChatPromptTemplate
 from langchain.chains import LLMChain
-from typing import Dict, Any
+from langchain.schema import SystemMessage
+from typing import Dict, Any, List
 from dotenv import load_dotenv
 import os
 import json
-import re
+import orjson
+import asyncio
 import logging
+import math
+import operator
+from types import MappingProxyType
+from enum import Enum
 import time
-from financial_tools import (
-    calculate_current_ratio, calculate_debt_to_equity_ratio,
-    calculate_gross_margin_ratio, calculate_operating_margin_ratio,
-    calculate_return_on_assets_ratio, calculate_return_on_equity_ratio,
-    calculate_asset_turnover_ratio, calculate_inventory_turnover_ratio,
-    calculate_receivables_turnover_ratio, calculate_debt_ratio,
-    calculate_interest_coverage_ratio
-)
-from prompts import EXTRACTION_PROMPT, OVERVIEW_PROMPT, FINDINGS_PROMPT
+import hashlib
+import weakref
+from functools import lru_cache
+from cachetools import TTLCache
+from aiolimiter import AsyncLimiter
+from financial_tools import RATIO_SPECS, calculate_ratios
+from prompts import EXTRACTION_PROMPT, EXTRACTION_PROMPT_SHORT, OVERVIEW_PROMPT, COMBINED_ANALYSIS_PROMPT
 
 load_dotenv()
 
+JSON_FENCE = "```json"
+_JSON_DECODER = json.JSONDecoder()
+
+# Prompt templates are parsed once at import and shared by every handler. The
+# extraction instructions are a fixed system message (their JSON example is not
+# a template) followed by the document
+EXTRACTION_TEMPLATE = ChatPromptTemplate.from_messages([
+    SystemMessage(content=EXTRACTION_PROMPT), ("human", "{document_content}")
+])
+SHORT_EXTRACTION_TEMPLATE = ChatPromptTemplate.from_messages([
+    SystemMessage(content=EXTRACTION_PROMPT_SHORT), ("human", "{document_content}")
+])
+# Documents shorter than this many characters use the compact extraction prompt
+SHORT_DOCUMENT_CHARS = 2000
+OVERVIEW_TEMPLATE = ChatPromptTemplate.from_template(OVERVIEW_PROMPT)
+COMBINED_ANALYSIS_TEMPLATE = ChatPromptTemplate.from_template(COMBINED_ANALYSIS_PROMPT)
+
+# Set LLM_VERBOSE=1 to have the chains print their prompts and responses
+LLM_VERBOSE = os.getenv("LLM_VERBOSE") == "1"
+
+# Gemini requests per minute allowed across all chains of a handler
+LLM_REQUESTS_PER_MINUTE = int(os.getenv("LLM_REQUESTS_PER_MINUTE", "500"))
+
+# Chain results keyed by a SHA-256 of the model, prompt, chain and inputs, so re-analyzing
+# the same document or data skips the LLM round-trip for a day
+response_cache = TTLCache(maxsize=256, ttl=86400)
+
+
+class Severity(str, Enum):
+    """Severity of an anomaly or red flag.
+
+    Members are shared singletons, so checks compare identities; as str
+    subclasses they still serialize and print as "High", "Medium" or "Low".
+    """
+    LOW = "Low"
+    MEDIUM = "Medium"
+    HIGH = "High"
+
+    __str__ = str.__str__
+    __format__ = str.__format__
+
+
+# Threshold checks on calculated ratios: (ratio, comparison, threshold, "High" severity
+# threshold, then the anomaly type and description, or the red flag category, issue,
+# details and recommendation). Descriptions are bound str.format methods of their
+# templates, called with the ratio value.
+RATIO_ANOMALY_RULES = (
+    ("Current Ratio", operator.lt, 1.0, 0.8, "Liquidity Risk",
+     "Current ratio is {value:.2f}, below the recommended 1.0 minimum".format),
+    ("Debt Ratio", operator.gt, 0.7, 0.8, "High Leverage",
+     "Debt ratio is {value:.2f}, indicating high financial leverage".format),
+)
+RATIO_RED_FLAG_RULES = (
+    ("Interest Coverage Ratio", operator.lt, 2.0, 1.0, "Solvency", "Low interest coverage ratio",
+     "Interest coverage ratio of {value:.2f} indicates potential difficulty in meeting interest obligations".format,
+     "Review debt structure and interest payment capabilities"),
+    ("Current Ratio", operator.lt, 1.0, 0.8, "Liquidity", "Working capital deficiency",
+     "Current ratio of {value:.2f} indicates insufficient short-term assets to cover short-term liabilities".format,
+     "Address short-term liquidity through debt restructuring or additional financing"),
+)
+
+
+# Typical ratio values per industry, stored as read-only (ratio, value) pairs
+INDUSTRY_BENCHMARKS = MappingProxyType({
+    industry: tuple(benchmarks.items())
+    for industry, benchmarks in {
+        "Retail": {"Current Ratio": 1.5, "Gross Margin Ratio": 0.25, "Inventory Turnover Ratio": 4.0, "Debt Ratio": 0.5},
+        "Manufacturing": {"Current Ratio": 1.8, "Gross Margin Ratio": 0.35, "Inventory Turnover Ratio": 5.0, "Debt Ratio": 0.45},
+        "Technology": {"Current Ratio": 2.5, "Gross Margin Ratio": 0.60, "Inventory Turnover Ratio": 10.0, "Debt Ratio": 0.35},
+        "Financial": {"Current Ratio": 1.1, "Return on Assets Ratio": 0.01, "Debt Ratio": 0.85, "Return on Equity Ratio": 0.12}
+    }.items()
+})
+
+
+def flagged_ratios(ratios: Dict, rules):
+    """Yield (rule, value, severity) for every rule whose ratio crosses its threshold."""
+    for rule in rules:
+        name, compare, threshold, high_threshold = rule[:4]
+        value = ratios.get(name, {}).get("ratio_value")
+        if isinstance(value, (int, float)) and compare(value, threshold):
+            yield rule, value, Severity.HIGH if compare(value, high_threshold) else Severity.MEDIUM
+
+
+def standard_ratio_inputs(data: Dict) -> Dict:
+    """Collect the RATIO_SPECS input fields from extracted data."""
+    income_statement = data.get('income_statement', {})
+    balance_sheet = data.get('balance_sheet', {})
+    inputs = {
+        field: income_statement.get(field, 0)
+        for field in ("gross_profit", "net_sales", "operating_income", "net_income",
+                      "cost_of_goods_sold", "interest_expenses")
+    }
+    inputs.update({
+        field: balance_sheet.get(field, 0)
+        for field in ("current_assets", "current_liabilities", "cash_and_equivalents", "total_liabilities",
+                      "shareholders_equity", "total_assets", "average_inventory", "average_accounts_receivable")
+    })
+    # Net sales stand in for net credit sales and total assets for average total assets
+    inputs["net_credit_sales"] = inputs["net_sales"]
+    inputs["average_total_assets"] = inputs["total_assets"]
+    return inputs
+
+
+def numeric_inputs(ratio_inputs: Dict) -> Dict:
+    """Replace non-numeric ratio inputs with None so they come out as NaN."""
+    return {field: value if isinstance(value, (int, float)) else None for field, value in ratio_inputs.items()}
+
+
+def standard_ratios(ratio_inputs: Dict, values) -> Dict:
+    """Build the per-ratio result dicts from the inputs and one value per RATIO_SPECS entry."""
+    return {
+        name: {
+            numerator: ratio_inputs[numerator],
+            denominator: ratio_inputs[denominator],
+            "ratio_value": value if math.isfinite(value) else "N/A"
+        }
+        for (name, numerator, denominator), value in zip(RATIO_SPECS, values)
+    }
+
+
+def pct_growth(current, previous):
+    """Percentage change from previous to current, or "N/A" when previous is zero."""
+    return (current - previous) / previous * 100 if previous else "N/A"
+
+
+def prompt_digest(template: ChatPromptTemplate) -> str:
+    """SHA-256 of a prompt template's messages, stored in a chain's metadata to identify its prompt."""
+    return hashlib.sha256(template.pretty_repr().encode()).hexdigest()
+
+
+def response_cache_key(chain: LLMChain, inputs: Dict) -> str:
+    """SHA-256 of the model, prompt, chain and inputs, ignoring differences in whitespace between words.
+
+    Re-exported or re-extracted copies of a document often differ only in line breaks
+    and spacing, so those still hit the cache. Chains can share a model and output key
+    (the full and short extraction chains do), so the prompt digest keeps them apart.
+    """
+    normalized = {
+        name: " ".join(value.split()) if isinstance(value, str) else value
+        for name, value in inputs.items()
+    }
+    return hashlib.sha256(
+        orjson.dumps([chain.llm.model, chain.metadata["prompt_digest"], chain.output_key, normalized],
+                     option=orjson.OPT_SORT_KEYS)
+    ).hexdigest()
+
+
+def to_prompt_json(value) -> str:
+    """Serialize a value as indented JSON for a prompt."""
+    return orjson.dumps(value, option=orjson.OPT_INDENT_2).decode()
+
+
+def find_json_block(text: str):
+    """Return the contents of the first ```json fenced block in text, or None."""
+    start = text.find(JSON_FENCE)
+    if start == -1:
+        return None
+    start += len(JSON_FENCE)
+    end = text.find("```", start)
+    if end == -1:
+        return None
+    return text[start:end].strip()
+
+
+def decode_first_json_object(text: str):
+    """Decode the first JSON object in text in a single linear pass, or return None."""
+    start = text.find("{")
+    if start == -1:
+        return None
+    try:
+        return _JSON_DECODER.raw_decode(text, start)[0]
+    except json.JSONDecodeError:
+        return None
+
+
+@lru_cache(maxsize=None)
+def get_llm(model: str, temperature: float) -> GoogleGenerativeAI:
+    """Return the shared LLM client for a model and temperature, built on first use."""
+    return GoogleGenerativeAI(
+        model=model,
+        temperature=temperature,
+        google_api_key=os.getenv("GOOGLE_API_KEY")
+    )
+
+
 class LangChainHandler:
     """Handles multi-step LLM operations for financial analysis."""
     
@@ -29,16 +218,14 @@ class LangChainHandler:
         if not api_key:
             raise ValueError("GOOGLE_API_KEY environment variable is not set")
             
-        self.extraction_llm = GoogleGenerativeAI(
-            model="gemini-2.0-flash", 
-            temperature=0.1,
-            google_api_key=api_key
-        )
-        self.analysis_llm = GoogleGenerativeAI(
-            model="gemini-2.0-flash-thinking-exp-01-21", 
-            temperature=0.2,
-            google_api_key=api_key
-        )
+        # Clients are shared between handlers so each one reuses the same connection
+        self.extraction_llm = get_llm("gemini-2.0-flash", 0.1)
+        self.analysis_llm = get_llm("gemini-2.0-flash-thinking-exp-01-21", 0.2)
+        
+        # Caps the chain calls in flight at once and per minute across every request using this handler.
+        # asyncio primitives bind to the loop they are first used on and the sync wrappers start a new
+        # loop per call, so each running loop gets its own pair (see _llm_limits)
+        self._llm_limits_by_loop = weakref.WeakKeyDictionary()
         
         # Setup the extraction chain
         self._setup_extraction_chain()
@@ -46,52 +233,49 @@ class LangChainHandler:
         # Setup the analysis chains
         self._setup_analysis_chains()
         
-        # NEW: Setup extra chains for sentiment and business model
-        from prompts import SENTIMENT_PROMPT, BUSINESS_MODEL_PROMPT
-        self.sentiment_prompt = ChatPromptTemplate.from_template(SENTIMENT_PROMPT)
-        self.sentiment_chain = LLMChain(
-            llm=self.analysis_llm,
-            prompt=self.sentiment_prompt,
-            output_key="sentiment_analysis",
-            verbose=True
-        )
-        self.business_model_prompt = ChatPromptTemplate.from_template(BUSINESS_MODEL_PROMPT)
-        self.business_model_chain = LLMChain(
-            llm=self.analysis_llm,
-            prompt=self.business_model_prompt,
-            output_key="business_model",
-            verbose=True
-        )
-        
     def _setup_extraction_chain(self):
-        """Set up the extraction chain for financial data"""
-        extraction_template = EXTRACTION_PROMPT
-        self.extraction_prompt = ChatPromptTemplate.from_template(extraction_template)
+        """Set up the extraction chains for financial data, with a compact variant for short documents"""
+        self.extraction_prompt = EXTRACTION_TEMPLATE
         self.extraction_chain = LLMChain(
             llm=self.extraction_llm, 
             prompt=self.extraction_prompt, 
             output_key="extracted_data",
-            verbose=True
+            metadata={"prompt_digest": prompt_digest(self.extraction_prompt)},
+            verbose=LLM_VERBOSE
         )
+        self.short_extraction_chain = LLMChain(
+            llm=self.extraction_llm,
+            prompt=SHORT_EXTRACTION_TEMPLATE,
+            output_key="extracted_data",
+            metadata={"prompt_digest": prompt_digest(SHORT_EXTRACTION_TEMPLATE)},
+            verbose=LLM_VERBOSE
+        )
+    
+    def _select_extraction_chain(self, document_content: str) -> LLMChain:
+        """Pick the compact extraction prompt for short documents and the full one otherwise."""
+        if len(document_content) < SHORT_DOCUMENT_CHARS:
+            return self.short_extraction_chain
+        return self.extraction_chain
     
     def _setup_analysis_chains(self):
-        """Set up chains for business overview and key findings"""
-        overview_template = OVERVIEW_PROMPT
-        self.overview_prompt = ChatPromptTemplate.from_template(overview_template)
+        """Set up chains for business overview and the combined key findings analysis"""
+        self.overview_prompt = OVERVIEW_TEMPLATE
         self.overview_chain = LLMChain(
             llm=self.analysis_llm,
             prompt=self.overview_prompt,
             output_key="business_overview",
-            verbose=True
+            metadata={"prompt_digest": prompt_digest(self.overview_prompt)},
+            verbose=LLM_VERBOSE
         )
         
-        findings_template = FINDINGS_PROMPT
-        self.findings_prompt = ChatPromptTemplate.from_template(findings_template)
-        self.findings_chain = LLMChain(
+        # Key findings, red flags, sentiment and business model come back from one call
+        self.combined_prompt = COMBINED_ANALYSIS_TEMPLATE
+        self.combined_chain = LLMChain(
             llm=self.analysis_llm,
-            prompt=self.findings_prompt,
-            output_key="key_findings",
-            verbose=True
+            prompt=self.combined_prompt,
+            output_key="combined",
+            metadata={"prompt_digest": prompt_digest(self.combined_prompt)},
+            verbose=LLM_VERBOSE
         )
     
     def calculate_financial_ratios(self, data: Dict) -> Dict:
@@ -101,145 +285,54 @@ class LangChainHandler:
         balance_sheet = data.get('balance_sheet', {})
         cash_flow = data.get('cash_flow', {})
         
-        # Values needed for ratio calculations
+        # Values needed for growth, cash flow and anomaly checks
         net_sales = income_statement.get('net_sales', 0)
-        cost_of_goods_sold = income_statement.get('cost_of_goods_sold', 0)
-        gross_profit = income_statement.get('gross_profit', 0)
         operating_income = income_statement.get('operating_income', 0)
         interest_expenses = income_statement.get('interest_expenses', 0)
         net_income = income_statement.get('net_income', 0)
         previous_year_sales = income_statement.get('previous_year_sales', 0)
         previous_year_net_income = income_statement.get('previous_year_net_income', 0)
         
-        cash_and_equivalents = balance_sheet.get('cash_and_equivalents', 0)
-        current_assets = balance_sheet.get('current_assets', 0)
         total_assets = balance_sheet.get('total_assets', 0)
-        current_liabilities = balance_sheet.get('current_liabilities', 0)
-        total_liabilities = balance_sheet.get('total_liabilities', 0)
-        shareholders_equity = balance_sheet.get('shareholders_equity', 0)
-        average_inventory = balance_sheet.get('average_inventory', 0)
-        average_accounts_receivable = balance_sheet.get('average_accounts_receivable', 0)
         previous_year_total_assets = balance_sheet.get('previous_year_total_assets', 0)
-        previous_year_total_liabilities = balance_sheet.get('previous_year_total_liabilities', 0)
         
         operating_cash_flow = cash_flow.get('operating_cash_flow', 0)
-        capital_expenditures = cash_flow.get('capital_expenditures', 0)
         free_cash_flow = cash_flow.get('free_cash_flow', 0)
         
-        # Use net_sales for net_credit_sales if not provided
-        net_credit_sales = net_sales
-        
-        # Calculate average_total_assets as total_assets if not provided
-        average_total_assets = total_assets
-        
-        # Helper function to safely calculate ratios
-        def safe_calculate(func, numerator, denominator, default=None):
-            try:
-                if denominator == 0:
-                    return default
-                return func(numerator, denominator)
-            except Exception:
-                return default
-        
-        # Standard ratios calculation (existing code)
-        ratios = {
-            "Current Ratio": {
-                "current_assets": current_assets,
-                "current_liabilities": current_liabilities,
-                "ratio_value": safe_calculate(calculate_current_ratio, current_assets, current_liabilities, "N/A")
-            },
-            "Cash Ratio": {
-                "cash_and_equivalents": cash_and_equivalents,
-                "current_liabilities": current_liabilities,
-                "ratio_value": safe_calculate(
-                    lambda cash, liab: cash / liab if liab != 0 else "N/A",
-                    cash_and_equivalents, current_liabilities, "N/A"
-                )
-            },
-            "Debt to Equity Ratio": {
-                "total_liabilities": total_liabilities,
-                "shareholders_equity": shareholders_equity,
-                "ratio_value": safe_calculate(calculate_debt_to_equity_ratio, total_liabilities, shareholders_equity, "N/A")
-            },
-            "Gross Margin Ratio": {
-                "gross_profit": gross_profit,
-                "net_sales": net_sales,
-                "ratio_value": safe_calculate(calculate_gross_margin_ratio, gross_profit, net_sales, "N/A")
-            },
-            "Operating Margin Ratio": {
-                "operating_income": operating_income,
-                "net_sales": net_sales,
-                "ratio_value": safe_calculate(calculate_operating_margin_ratio, operating_income, net_sales, "N/A")
-            },
-            "Return on Assets Ratio": {
-                "net_income": net_income,
-                "total_assets": total_assets,
-                "ratio_value": safe_calculate(calculate_return_on_assets_ratio, net_income, total_assets, "N/A")
-            },
-            "Return on Equity Ratio": {
-                "net_income": net_income,
-                "shareholders_equity": shareholders_equity,
-                "ratio_value": safe_calculate(calculate_return_on_equity_ratio, net_income, shareholders_equity, "N/A")
-            },
-            "Asset Turnover Ratio": {
-                "net_sales": net_sales,
-                "average_total_assets": average_total_assets,
-                "ratio_value": safe_calculate(calculate_asset_turnover_ratio, net_sales, average_total_assets, "N/A")
-            },
-            "Inventory Turnover Ratio": {
-                "cost_of_goods_sold": cost_of_goods_sold,
-                "average_inventory": average_inventory,
-                "ratio_value": safe_calculate(calculate_inventory_turnover_ratio, cost_of_goods_sold, average_inventory, "N/A")
-            },
-            "Receivables Turnover Ratio": {
-                "net_credit_sales": net_credit_sales,
-                "average_accounts_receivable": average_accounts_receivable,
-                "ratio_value": safe_calculate(calculate_receivables_turnover_ratio, net_credit_sales, average_accounts_receivable, "N/A")
-            },
-            "Debt Ratio": {
-                "total_liabilities": total_liabilities,
-                "total_assets": total_assets,
-                "ratio_value": safe_calculate(calculate_debt_ratio, total_liabilities, total_assets, "N/A")
-            },
-            "Interest Coverage Ratio": {
-                "operating_income": operating_income,
-                "interest_expenses": interest_expenses,
-                "ratio_value": safe_calculate(calculate_interest_coverage_ratio, operating_income, interest_expenses, "N/A")
-            }
-        }
+        # Standard ratios, all evaluated in one vectorized pass; non-numeric inputs
+        # and zero denominators are reported as "N/A"
+        ratio_inputs = standard_ratio_inputs(data)
+        ratios = standard_ratios(ratio_inputs, calculate_ratios(numeric_inputs(ratio_inputs)).tolist())
         
         # Add growth metrics
         if previous_year_sales and net_sales:
-            sales_growth = ((net_sales - previous_year_sales) / previous_year_sales) * 100 if previous_year_sales != 0 else "N/A"
             ratios["Sales Growth"] = {
                 "current_sales": net_sales,
                 "previous_sales": previous_year_sales,
-                "growth_percentage": sales_growth
+                "growth_percentage": pct_growth(net_sales, previous_year_sales)
             }
         
         if previous_year_net_income and net_income:
-            profit_growth = ((net_income - previous_year_net_income) / previous_year_net_income) * 100 if previous_year_net_income != 0 else "N/A"
             ratios["Profit Growth"] = {
                 "current_net_income": net_income,
                 "previous_net_income": previous_year_net_income,
-                "growth_percentage": profit_growth
+                "growth_percentage": pct_growth(net_income, previous_year_net_income)
             }
         
         if previous_year_total_assets and total_assets:
-            asset_growth = ((total_assets - previous_year_total_assets) / previous_year_total_assets) * 100 if previous_year_total_assets != 0 else "N/A"
             ratios["Asset Growth"] = {
                 "current_assets": total_assets,
                 "previous_assets": previous_year_total_assets,
-                "growth_percentage": asset_growth
+                "growth_percentage": pct_growth(total_assets, previous_year_total_assets)
             }
         
         # Add cash flow metrics
         if operating_cash_flow and net_income:
-            cash_to_income_ratio = safe_calculate(lambda x, y: x / y, operating_cash_flow, net_income, "N/A")
+            # Both values are non-zero here, so the division is safe
             ratios["Cash Flow to Net Income Ratio"] = {
                 "operating_cash_flow": operating_cash_flow,
                 "net_income": net_income,
-                "ratio_value": cash_to_income_ratio
+                "ratio_value": operating_cash_flow / net_income
             }
         
         if free_cash_flow is not None:
@@ -251,27 +344,20 @@ class LangChainHandler:
         anomalies = []
         
         # Check for suspicious profitability patterns
-        if net_income > operating_income and interest_expenses > 0:
+        if (all(isinstance(value, (int, float)) for value in (net_income, operating_income, interest_expenses))
+                and net_income > operating_income and interest_expenses > 0):
             anomalies.append({
                 "type": "Income Anomaly",
                 "description": "Net income exceeds operating income despite interest expenses",
-                "severity": "Medium"
+                "severity": Severity.MEDIUM
             })
         
-        # Check for liquidity concerns
-        if isinstance(ratios["Current Ratio"]["ratio_value"], (int, float)) and ratios["Current Ratio"]["ratio_value"] < 1.0:
+        # Check for liquidity concerns and high leverage
+        for (*_, anomaly_type, description), value, severity in flagged_ratios(ratios, RATIO_ANOMALY_RULES):
             anomalies.append({
-                "type": "Liquidity Risk",
-                "description": f"Current ratio is {ratios['Current Ratio']['ratio_value']:.2f}, below the recommended 1.0 minimum",
-                "severity": "High" if ratios["Current Ratio"]["ratio_value"] < 0.8 else "Medium"
-            })
-        
-        # Check for high leverage
-        if isinstance(ratios["Debt Ratio"]["ratio_value"], (int, float)) and ratios["Debt Ratio"]["ratio_value"] > 0.7:
-            anomalies.append({
-                "type": "High Leverage",
-                "description": f"Debt ratio is {ratios['Debt Ratio']['ratio_value']:.2f}, indicating high financial leverage",
-                "severity": "High" if ratios["Debt Ratio"]["ratio_value"] > 0.8 else "Medium"
+                "type": anomaly_type,
+                "description": description(value=value),
+                "severity": severity
             })
         
         # Check for cash flow vs. net income discrepancy
@@ -280,13 +366,13 @@ class LangChainHandler:
                 anomalies.append({
                     "type": "Cash Flow Discrepancy",
                     "description": "Positive net income but negative operating cash flow suggests potential earnings quality issues",
-                    "severity": "High"
+                    "severity": Severity.HIGH
                 })
             elif operating_cash_flow / net_income < 0.5 and net_income > 0:
                 anomalies.append({
                     "type": "Cash Flow Discrepancy",
                     "description": f"Operating cash flow is only {(operating_cash_flow/net_income)*100:.0f}% of net income, suggesting potential earnings quality issues",
-                    "severity": "Medium"
+                    "severity": Severity.MEDIUM
                 })
         
         # Add anomalies to the ratios dictionary
@@ -294,6 +380,23 @@ class LangChainHandler:
         
         return ratios
     
+    def calculate_financial_ratios_batch(self, documents: List[Dict]) -> List[Dict]:
+        """
+        Calculate the standard ratios for many extracted documents in one vectorized pass.
+        Returns one dict per document with the same standard ratio entries as
+        calculate_financial_ratios; growth, cash flow metrics and anomalies are not included.
+        """
+        if not documents:
+            return []
+        inputs = [standard_ratio_inputs(data) for data in documents]
+        numeric = [numeric_inputs(ratio_inputs) for ratio_inputs in inputs]
+        ratio_values = calculate_ratios({field: [doc[field] for doc in numeric] for field in numeric[0]})
+        # ratio_values has one row per ratio and one column per document
+        return [
+            standard_ratios(ratio_inputs, values)
+            for ratio_inputs, values in zip(inputs, ratio_values.T.tolist())
+        ]
+    
     def detect_financial_red_flags(self, data: Dict, ratios: Dict) -> Dict:
         """
         Detect potential red flags and anomalies in financial data that could 
@@ -320,7 +423,7 @@ class LangChainHandler:
                     "category": "Revenue",
                     "issue": "Unusually high revenue growth",
                     "details": f"{growth_rate*100:.1f}% increase in revenue from previous year",
-                    "severity": "Medium",
+                    "severity": Severity.MEDIUM,
                     "recommendation": "Verify revenue recognition policies and major sales events"
                 })
         
@@ -330,40 +433,65 @@ class LangChainHandler:
                 "category": "Cash Flow",
                 "issue": "Net income significantly exceeds operating cash flow",
                 "details": f"Net income is {net_income/operating_cash_flow:.1f}x higher than operating cash flow",
-                "severity": "High",
+                "severity": Severity.HIGH,
                 "recommendation": "Investigate accruals and revenue recognition"
             })
         
-        # Red flag: Interest coverage concerns
-        interest_coverage = ratios.get('Interest Coverage Ratio', {}).get('ratio_value')
-        if isinstance(interest_coverage, (int, float)) and interest_coverage < 2.0:
-            red_flags.append({
-                "category": "Solvency",
-                "issue": "Low interest coverage ratio",
-                "details": f"Interest coverage ratio of {interest_coverage:.2f} indicates potential difficulty in meeting interest obligations",
-                "severity": "High" if interest_coverage < 1.0 else "Medium",
-                "recommendation": "Review debt structure and interest payment capabilities"
-            })
-        
-        # Red flag: Working capital concerns
-        current_ratio = ratios.get('Current Ratio', {}).get('ratio_value')
-        if isinstance(current_ratio, (int, float)) and current_ratio < 1.0:
+        # Red flags: Interest coverage and working capital concerns
+        for (*_, category, issue, details, recommendation), value, severity in flagged_ratios(ratios, RATIO_RED_FLAG_RULES):
             red_flags.append({
-                "category": "Liquidity",
-                "issue": "Working capital deficiency",
-                "details": f"Current ratio of {current_ratio:.2f} indicates insufficient short-term assets to cover short-term liabilities",
-                "severity": "High" if current_ratio < 0.8 else "Medium",
-                "recommendation": "Address short-term liquidity through debt restructuring or additional financing"
+                "category": category,
+                "issue": issue,
+                "details": details(value=value),
+                "severity": severity,
+                "recommendation": recommendation
             })
         
         # Return the list of red flags
         return {
             "red_flags": red_flags,
-            "has_critical_issues": any(flag["severity"] == "High" for flag in red_flags),
+            "has_critical_issues": any(flag["severity"] is Severity.HIGH for flag in red_flags),
             "has_concerns": len(red_flags) > 0
         }
     
+    def _llm_limits(self):
+        """Return the (concurrency semaphore, rate limiter) pair for the running event loop."""
+        loop = asyncio.get_running_loop()
+        limits = self._llm_limits_by_loop.get(loop)
+        if limits is None:
+            limits = self._llm_limits_by_loop[loop] = (asyncio.Semaphore(5), AsyncLimiter(LLM_REQUESTS_PER_MINUTE, 60))
+        return limits
+    
+    async def _ainvoke(self, chain: LLMChain, inputs: Dict) -> Dict:
+        """Run a chain asynchronously, waiting for a free slot and the rate limit first, or return its cached result."""
+        key = response_cache_key(chain, inputs)
+        if (cached := response_cache.get(key)) is not None:
+            return cached
+        llm_slots, llm_rate = self._llm_limits()
+        async with llm_slots, llm_rate:
+            result = await chain.ainvoke(inputs)
+        response_cache[key] = result
+        return result
+    
     def analyze_financial_document(self, document_content: str) -> Dict[str, Any]:
+        """Synchronous wrapper around aanalyze_financial_document for callers without an event loop."""
+        return asyncio.run(self.aanalyze_financial_document(document_content))
+    
+    async def analyze_documents_batch(self, documents: List[str], max_concurrency: int = 10) -> List[Dict[str, Any]]:
+        """
+        Analyze several documents concurrently and return their results in input order.
+        At most max_concurrency documents are analyzed at once; the handler's LLM
+        concurrency and rate limits still apply to the calls each analysis makes.
+        """
+        slots = asyncio.Semaphore(max_concurrency)
+        
+        async def analyze(document_content: str) -> Dict[str, Any]:
+            async with slots:
+                return await self.aanalyze_financial_document(document_content)
+        
+        return await asyncio.gather(*(analyze(document_content) for document_content in documents))
+    
+    async def aanalyze_financial_document(self, document_content: str) -> Dict[str, Any]:
         """
         Analyze a financial document and return extracted data and calculated ratios
         
@@ -378,31 +506,34 @@ class LangChainHandler:
             if not document_content or len(document_content.strip()) == 0:
                 raise ValueError("Document content is empty")
                 
-            logging.info(f"Starting financial document analysis. Document length: {len(document_content)} characters")
+            logging.info("Starting financial document analysis. Document length: %d characters", len(document_content))
             start_time = time.time()
             
             # Step 1: Extract financial data
             logging.info("Step 1: Extracting financial data...")
-            extraction_result = self.extraction_chain.invoke({"document_content": document_content})
+            extraction_chain = self._select_extraction_chain(document_content)
+            extraction_result = await self._ainvoke(extraction_chain, {"document_content": document_content})
             
-            logging.info(f"Raw extraction result: {extraction_result['extracted_data'][:200]}...")
+            logging.info("Raw extraction result: %.200s...", extraction_result["extracted_data"])
             
             # Convert the string JSON to a Python dict
             try:
                 # First try direct JSON parsing
-                extracted_data = json.loads(extraction_result["extracted_data"])
+                extracted_data = orjson.loads(extraction_result["extracted_data"])
                 logging.info("Successfully parsed JSON directly")
             except json.JSONDecodeError:
                 # If that fails, try to extract JSON from the response text
                 logging.info("Direct JSON parsing failed, trying to extract JSON from text")
-                json_match = re.search(r'```json\s*(.*?)\s*```', extraction_result["extracted_data"], re.DOTALL)
-                if json_match:
+                json_block = find_json_block(extraction_result["extracted_data"])
+                if json_block is not None:
                     try:
-                        extracted_data = json.loads(json_match.group(1))
+                        extracted_data = orjson.loads(json_block)
                         logging.info("Successfully extracted and parsed JSON from text")
                     except json.JSONDecodeError as e:
-                        logging.error(f"JSON parsing error after extraction: {e}")
+                        logging.error("JSON parsing error after extraction: %s", e)
                         raise ValueError(f"Invalid JSON format after extraction: {e}")
+                elif (extracted_data := decode_first_json_object(extraction_result["extracted_data"])) is not None:
+                    logging.info("Successfully parsed the first JSON object in the text")
                 else:
                     # If no JSON block found, provide a fallback empty structure
                     logging.error("No valid JSON found in extraction result")
@@ -432,13 +563,19 @@ class LangChainHandler:
             logging.info("Step 3: Detecting financial red flags and anomalies...")
             red_flags = self.detect_financial_red_flags(extracted_data, calculated_ratios)
             
-            # Step 4: Generate business overview and key findings
+            # Step 4: Generate business overview and key findings concurrently,
+            # serializing the data once for both prompts
             logging.info("Step 4: Generating business overview and key findings...")
-            business_overview = self.generate_business_overview(extracted_data)
-            key_findings = self.generate_key_findings(extracted_data, calculated_ratios)
+            self.add_benchmarks_and_anomalies(extracted_data, calculated_ratios)
+            extracted_json = to_prompt_json(extracted_data)
+            business_overview, key_findings = await asyncio.gather(
+                self.agenerate_business_overview(extracted_data, extracted_json),
+                self.agenerate_key_findings(extracted_data, calculated_ratios, extracted_json,
+                                            to_prompt_json(calculated_ratios))
+            )
             
             end_time = time.time()
-            logging.info(f"Financial analysis completed in {end_time - start_time:.2f} seconds")
+            logging.info("Financial analysis completed in %.2f seconds", end_time - start_time)
             
             # Return combined result
             return {
@@ -461,13 +598,40 @@ class LangChainHandler:
                 "key_findings": "Error analyzing document: " + str(e)
             }
             
+    def add_benchmarks_and_anomalies(self, extracted_data: Dict, calculated_ratios: Dict) -> None:
+        """Add industry benchmark comparisons and detected anomalies to extracted_data for the analysis prompt."""
+        industry = extracted_data.get("industry", "")
+        if industry and industry in INDUSTRY_BENCHMARKS:
+            benchmark_data = []
+            for ratio_name, benchmark_value in INDUSTRY_BENCHMARKS[industry]:
+                ratio_data = calculated_ratios.get(ratio_name, {})
+                actual_value = ratio_data.get("ratio_value", "N/A")
+                if isinstance(actual_value, (int, float)):
+                    comparison = "above" if actual_value > benchmark_value else "below"
+                    benchmark_data.append({
+                        "ratio": ratio_name,
+                        "actual": actual_value,
+                        "benchmark": benchmark_value,
+                        "comparison": comparison
+                    })
+            if benchmark_data:
+                extracted_data["industry_benchmarks"] = benchmark_data
+
+        if "Anomalies" in calculated_ratios and calculated_ratios["Anomalies"]:
+            extracted_data["anomalies"] = calculated_ratios["Anomalies"]
+
     def generate_business_overview(self, extracted_data: Dict) -> str:
+        """Synchronous wrapper around agenerate_business_overview."""
+        return asyncio.run(self.agenerate_business_overview(extracted_data))
+    
+    async def agenerate_business_overview(self, extracted_data: Dict, extracted_json: str = None) -> str:
         """
         Generate a concise business overview based on the extracted data.
+        Pass extracted_json when the caller has already serialized extracted_data.
         """
         try:
-            result = self.overview_chain.invoke({
-                "extracted_data": json.dumps(extracted_data, indent=2)
+            result = await self._ainvoke(self.overview_chain, {
+                "extracted_data": extracted_json or to_prompt_json(extracted_data)
             })
             return result["business_overview"].strip()
         except Exception as e:
@@ -475,57 +639,37 @@ class LangChainHandler:
             return f"Error generating business overview: {str(e)}"
         
     def generate_key_findings(self, extracted_data: Dict, calculated_ratios: Dict) -> Dict:
+        """Synchronous wrapper around agenerate_key_findings."""
+        return asyncio.run(self.agenerate_key_findings(extracted_data, calculated_ratios))
+    
+    async def agenerate_key_findings(self, extracted_data: Dict, calculated_ratios: Dict,
+                                     extracted_json: str = None, ratios_json: str = None) -> Dict:
         """
         Generate key findings and insights based on the extracted data and calculated ratios.
         Returns a JSON dict with keys: 'key_findings', 'red_flags', 'sentiment_analysis', and 'business_model'.
+        extracted_json and ratios_json may be passed pre-serialized; extracted_json must then
+        already include the benchmarks and anomalies from add_benchmarks_and_anomalies.
         """
         try:
-            # If there are benchmarks and anomalies, add them to extracted_data.
-            industry = extracted_data.get("industry", "")
-            industry_benchmarks = {
-                "Retail": {"Current Ratio": 1.5, "Gross Margin Ratio": 0.25, "Inventory Turnover Ratio": 4.0, "Debt Ratio": 0.5},
-                "Manufacturing": {"Current Ratio": 1.8, "Gross Margin Ratio": 0.35, "Inventory Turnover Ratio": 5.0, "Debt Ratio": 0.45},
-                "Technology": {"Current Ratio": 2.5, "Gross Margin Ratio": 0.60, "Inventory Turnover Ratio": 10.0, "Debt Ratio": 0.35},
-                "Financial": {"Current Ratio": 1.1, "Return on Assets Ratio": 0.01, "Debt Ratio": 0.85, "Return on Equity Ratio": 0.12}
-            }
-            if industry and industry in industry_benchmarks:
-                benchmark_data = []
-                for ratio_name, benchmark_value in industry_benchmarks[industry].items():
-                    ratio_data = calculated_ratios.get(ratio_name, {})
-                    actual_value = ratio_data.get("ratio_value", "N/A")
-                    if isinstance(actual_value, (int, float)) and isinstance(benchmark_value, (int, float)):
-                        comparison = "above" if actual_value > benchmark_value else "below"
-                        benchmark_data.append({
-                            "ratio": ratio_name,
-                            "actual": actual_value,
-                            "benchmark": benchmark_value,
-                            "comparison": comparison
-                        })
-                if benchmark_data:
-                    extracted_data["industry_benchmarks"] = benchmark_data
-
-            if "Anomalies" in calculated_ratios and calculated_ratios["Anomalies"]:
-                extracted_data["anomalies"] = calculated_ratios["Anomalies"]
-
-            result = self.findings_chain.invoke({
-                "extracted_data": json.dumps(extracted_data, indent=2),
-                "calculated_ratios": json.dumps(calculated_ratios, indent=2)
-            })
-            parsed = json.loads(result["key_findings"])
-            key_findings = parsed.get("key_findings", "")
-            red_flags = parsed.get("red_flags", [])
-            # NEW: Obtain sentiment analysis and business model recommendations
-            sentiment_result = self.sentiment_chain.invoke({
-                "extracted_data": json.dumps(extracted_data, indent=2)
-            })
-            business_model_result = self.business_model_chain.invoke({
-                "extracted_data": json.dumps(extracted_data, indent=2)
+            if extracted_json is None:
+                self.add_benchmarks_and_anomalies(extracted_data, calculated_ratios)
+                extracted_json = to_prompt_json(extracted_data)
+            if ratios_json is None:
+                ratios_json = to_prompt_json(calculated_ratios)
+
+            # One call sends the data once and returns all four sections as JSON
+            result = await self._ainvoke(self.combined_chain, {
+                "extracted_data": extracted_json,
+                "calculated_ratios": ratios_json
             })
+            parsed = decode_first_json_object(result["combined"])
+            if parsed is None:
+                raise ValueError("No valid JSON found in key findings response")
             return {
-                "key_findings": key_findings,
-                "red_flags": red_flags,
-                "sentiment_analysis": sentiment_result.get("sentiment_analysis", "").strip(),
-                "business_model": business_model_result.get("business_model", "").strip()
+                "key_findings": parsed.get("key_findings", ""),
+                "red_flags": parsed.get("red_flags", []),
+                "sentiment_analysis": parsed.get("sentiment_analysis", "").strip(),
+                "business_model": parsed.get("business_model", "").strip()
             }
         except Exception as e:
             logging.exception("Error generating key findings")
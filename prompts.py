@@ -55,6 +55,17 @@ If you can identify the industry the company operates in, include it in the "ind
 
 Remember to format your response ONLY as valid JSON within the ```json and ``` tags. Do not add any additional explanation before or after the JSON."""
 
+# Compact variant of EXTRACTION_PROMPT for short documents, where the full example
+# would outweigh the document itself
+EXTRACTION_PROMPT_SHORT = """You are a financial analyst extracting key data from a financial statement.
+Output ONLY valid JSON within ```json and ``` tags, with these keys:
+company_name, reporting_period, currency, industry,
+income_statement (net_sales, cost_of_goods_sold, gross_profit, operating_expenses, operating_income, interest_expenses, net_income, previous_year_sales, previous_year_net_income),
+balance_sheet (cash_and_equivalents, current_assets, total_assets, current_liabilities, total_liabilities, shareholders_equity, average_inventory, average_accounts_receivable, previous_year_total_assets, previous_year_total_liabilities),
+cash_flow (operating_cash_flow, capital_expenditures, free_cash_flow),
+notes (adj_ebitda_available, adj_ebitda_details, adj_working_capital_available, adj_working_capital_details, risk_factors, significant_events).
+Use null for unavailable numbers and "" for unavailable text. Convert amounts with units to actual numbers. risk_factors and significant_events are lists."""
+
 OVERVIEW_PROMPT = """Based on the extracted financial data, provide a detailed business overview. 
 Include the following sections clearly:
 
@@ -82,73 +93,58 @@ The data provided is:
 
 Format your response as continuous paragraphs with appropriate section headings. If specific information is unavailable, briefly acknowledge this rather than making assumptions."""
 
-FINDINGS_PROMPT = """As a financial analyst, provide detailed key findings and insights based on the following financial data:
-
-Extracted Data:
-{extracted_data}
+REPORT_PROMPT = """You are a financial analyst preparing a due diligence report from the provided document.
+Respond with the extracted financial data and a business overview.
 
-Calculated Ratios:
-{calculated_ratios}
+For "extracted_data":
+If any information is not available, use null for numeric values and an empty string for text.
+If numbers have units (like thousands or millions), make sure to convert them to actual numbers.
+If you see values for multiple years, extract both the current year and previous year data where indicated.
+For average values (like average inventory), calculate them if provided with beginning and ending values, or use the most recent value if only one is available.
+For risk factors and significant events, extract any mentions of major risks, unusual transactions, legal issues, or significant business events.
+If you can identify the industry the company operates in, include it in the "industry" field.
 
-Please include these specific sections:
+For "business_overview", write continuous paragraphs with these section headings:
 
-1. EXECUTIVE SUMMARY: 2-3 paragraphs highlighting the most critical insights
+1. COMPANY PROFILE: core business activities and main products/services, industry and market position, size and scale of operations
+2. LEADERSHIP & GOVERNANCE: CEO and key executive names if mentioned, board composition if available, ownership structure
+3. RECENT DEVELOPMENTS: major business events, acquisitions, restructuring or strategic shifts, and significant changes in financial figures with potential reasons
+4. FINANCIAL HIGHLIGHTS: the most important financial metrics and notable trends in the data
 
-2. PROFITABILITY ANALYSIS:
-   - Detailed assessment of gross margin, operating margin, ROA, and ROE
-   - Whether each metric is strong or weak compared to typical standards
-   - Likely causes for the observed performance
-   - Recommendations for improvement
+If specific information is unavailable, briefly acknowledge this rather than making assumptions."""
 
-3. LIQUIDITY & SOLVENCY ASSESSMENT:
-   - Analysis of current ratio, cash ratio, debt ratio, and interest coverage
-   - Risk evaluation based on these metrics
-   - Recommendations for optimal capital structure
+COMBINED_ANALYSIS_PROMPT = """As a financial analyst, analyze the following financial data and provide key findings, red flags, a management sentiment analysis and business model recommendations in a single response.
 
-4. EFFICIENCY EVALUATION:
-   - Analysis of asset turnover, inventory turnover, and receivables turnover
-   - Operational improvements needed
-   - Industry comparisons where possible
+Extracted Data:
+{extracted_data}
 
-5. NOTABLE TRENDS:
-   - Year-over-year changes (if data available)
-   - Unusual patterns or anomalies
-   - Correlation between different financial metrics
+Calculated Ratios:
+{calculated_ratios}
 
+For "key_findings", include these specific sections:
+1. EXECUTIVE SUMMARY: 2-3 paragraphs highlighting the most critical insights
+2. PROFITABILITY ANALYSIS: assessment of gross margin, operating margin, ROA, and ROE, whether each is strong or weak compared to typical standards, likely causes and recommendations for improvement
+3. LIQUIDITY & SOLVENCY ASSESSMENT: analysis of current ratio, cash ratio, debt ratio, and interest coverage, risk evaluation and recommendations for optimal capital structure
+4. EFFICIENCY EVALUATION: analysis of asset turnover, inventory turnover, and receivables turnover, operational improvements needed and industry comparisons where possible
+5. NOTABLE TRENDS: year-over-year changes (if data available), unusual patterns or anomalies and correlation between different financial metrics
 For each section, explain the real-world business implications of the numbers, potential causes, and actionable insights.
 
-Return your complete response as valid JSON with the following structure:
-{
-  "key_findings": "<Your formatted analysis as a string with proper formatting>",
-  "red_flags": [<List of red flag objects with "issue", "severity", and "recommendation" fields>]
-}"""
+For "red_flags", list each issue with its "severity" (High, Medium or Low) and a "recommendation".
 
-SENTIMENT_PROMPT = """Analyze the management commentary and tone in the provided financial document and provide a detailed sentiment analysis.
-
-Focus on:
+For "sentiment_analysis", assess management commentary and tone:
 1. OVERALL TONE: Is management primarily optimistic, neutral, cautious, or negative?
 2. KEY PHRASES: What specific language indicates their outlook?
 3. FORWARD-LOOKING STATEMENTS: How do they characterize future prospects?
 4. RISK DISCLOSURE: How transparent are they about challenges?
 5. CONSISTENCY: Does their tone match the actual financial results?
+If management commentary is limited, note this limitation and base your assessment on the available information.
 
-The financial data is:
-{extracted_data}
-
-Format your response as a structured analysis with clear sections. Use specific examples from the text when available. If management commentary is limited, note this limitation and base your assessment on the available information. Provide a balanced assessment that would be valuable to investors."""
+For "business_model", recommend 2-3 innovative business model enhancements or pivots. For each one give the CONCEPT, STRATEGIC RATIONALE, IMPLEMENTATION APPROACH, EXPECTED FINANCIAL IMPACT and RISK CONSIDERATIONS, based on observable financial patterns.
 
-BUSINESS_MODEL_PROMPT = """Based on this financial data, recommend 2-3 innovative business model enhancements or pivots that could benefit the company.
-
-Financial Data:
-{extracted_data}
-
-For each recommendation:
-1. CONCEPT: Describe a specific business model innovation aligned with the company's industry and financial position.
-2. STRATEGIC RATIONALE: Explain why this model makes sense given their financial strengths/weaknesses.
-3. IMPLEMENTATION APPROACH: Outline key steps for adoption.
-4. EXPECTED FINANCIAL IMPACT: Project potential effects on revenue, margins, and overall financial health.
-5. RISK CONSIDERATIONS: Identify implementation challenges and mitigation strategies.
-
-Focus on actionable, realistic recommendations based on observable financial patterns. If the company shows strong liquidity but poor margins, consider models to enhance profitability. If growth is stalling, suggest expansion strategies.
-
-Format your response with clear headings and bullet points for each recommendation."""
+Return your complete response as valid JSON with the following structure:
+{{
+  "key_findings": "<Your formatted analysis as a string with proper formatting>",
+  "red_flags": [{{"issue": "<issue>", "severity": "<High|Medium|Low>", "recommendation": "<recommendation>"}}],
+  "sentiment_analysis": "<Your sentiment analysis as a string with clear sections>",
+  "business_model": "<Your recommendations as a string with headings and bullet points>"
+}}"""
@@ -13,7 +13,6 @@ import json
 import io
 import matplotlib.pyplot as plt
 import numpy as np
-import tempfile
 import os
 from datetime import datetime
 import matplotlib
@@ -175,9 +174,10 @@ def create_bar_chart(data, title, colors_list=None):
     
     return Image(img_data, width=6.5*inch, height=4*inch)
 
-def generate_pdf_report(report_data: dict, output_path: str):
+def generate_pdf_report(report_data: dict, output_path):
     """
     Generate a visually appealing PDF report based on provided report data.
+    output_path may be a file path or a writable binary file object such as io.BytesIO.
 
     report_data should be a dict such as:
     {
@@ -3,7 +3,6 @@ import sys
 import time
 import webbrowser
 import os
-from pathlib import Path
 
 def run_command(command):
     """Run a command in a new process"""
@@ -12,10 +11,6 @@ def run_command(command):
 
 def setup_environment():
     """Setup the environment for the application"""
-    # Create temp_uploads directory if it doesn't exist
-    upload_dir = Path("temp_uploads")
-    upload_dir.mkdir(exist_ok=True)
-    
     # Check if .env file exists and has API key
     if not os.path.exists(".env"):
         print("Error: .env file not found!")
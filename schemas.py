@@ -0,0 +1,75 @@
+from pydantic import BaseModel
+from typing import List, Optional
+
+
+class ChatMessage(BaseModel):
+    role: str
+    content: str
+
+
+class ChatRequest(BaseModel):
+    messages: List[ChatMessage]
+    session_id: Optional[str] = None
+
+
+class ChatResponse(BaseModel):
+    response: str
+    session_id: str
+
+
+# Structured output of the /generate_report extraction call. Fields are
+# nullable rather than defaulted because the Gemini API rejects schema defaults.
+class IncomeStatement(BaseModel):
+    net_sales: Optional[float]
+    cost_of_goods_sold: Optional[float]
+    gross_profit: Optional[float]
+    operating_expenses: Optional[float]
+    operating_income: Optional[float]
+    interest_expenses: Optional[float]
+    net_income: Optional[float]
+    previous_year_sales: Optional[float]
+    previous_year_net_income: Optional[float]
+
+
+class BalanceSheet(BaseModel):
+    cash_and_equivalents: Optional[float]
+    current_assets: Optional[float]
+    total_assets: Optional[float]
+    current_liabilities: Optional[float]
+    total_liabilities: Optional[float]
+    shareholders_equity: Optional[float]
+    average_inventory: Optional[float]
+    average_accounts_receivable: Optional[float]
+    previous_year_total_assets: Optional[float]
+    previous_year_total_liabilities: Optional[float]
+
+
+class CashFlow(BaseModel):
+    operating_cash_flow: Optional[float]
+    capital_expenditures: Optional[float]
+    free_cash_flow: Optional[float]
+
+
+class Notes(BaseModel):
+    adj_ebitda_available: bool
+    adj_ebitda_details: str
+    adj_working_capital_available: bool
+    adj_working_capital_details: str
+    risk_factors: List[str]
+    significant_events: List[str]
+
+
+class ExtractedData(BaseModel):
+    company_name: str
+    reporting_period: str
+    currency: str
+    industry: str
+    income_statement: IncomeStatement
+    balance_sheet: BalanceSheet
+    cash_flow: CashFlow
+    notes: Notes
+
+
+class ReportPayload(BaseModel):
+    extracted_data: ExtractedData
+    business_overview: str
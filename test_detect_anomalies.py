@@ -0,0 +1,42 @@
+import os
+
+os.environ.setdefault("GOOGLE_API_KEY", "test")
+
+from fastapi.testclient import TestClient
+
+import backend
+
+client = TestClient(backend.app)
+
+# Comfortably more than pyarrow's default 1 MB block, so the last rows are
+# parsed in a later block than the one column types are inferred from
+FIRST_BLOCK_ROWS = 600_000
+
+
+def csv_with_tail(*tail_rows):
+    """A Value column of alternating integer 1s and 2s, followed by tail_rows."""
+    rows = ["Value"] + [str(1 + i % 2) for i in range(FIRST_BLOCK_ROWS)] + list(tail_rows)
+    return ("\n".join(rows) + "\n").encode()
+
+
+def post_csv(content):
+    return client.post("/detect_anomalies", files={"file": ("data.csv", content, "text/csv")})
+
+
+def test_decimal_and_null_past_first_block():
+    response = post_csv(csv_with_tail("N/A", "1000.5"))
+    assert response.status_code == 200
+    anomalies = response.json()["anomalies"]
+    assert [anomaly["Value"] for anomaly in anomalies] == [1000.5]
+    assert anomalies[0]["Year"] == FIRST_BLOCK_ROWS + 1
+
+
+def test_text_in_numeric_column_past_first_block():
+    response = post_csv(csv_with_tail("not a number"))
+    assert response.status_code == 400
+    assert "Invalid CSV data" in response.json()["detail"]
+
+
+def test_empty_file():
+    response = post_csv(b"")
+    assert response.status_code == 400
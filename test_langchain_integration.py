@@ -0,0 +1,71 @@
+import os
+
+os.environ.setdefault("GOOGLE_API_KEY", "test")
+
+import asyncio
+from types import SimpleNamespace
+
+import orjson
+
+from langchain_integration import LangChainHandler, response_cache_key
+
+
+class StubChain:
+    """Stands in for an LLMChain, answering with a fixed output and recording how many calls overlap."""
+
+    def __init__(self, output_key, respond, delay=lambda inputs: 0.01):
+        self.llm = SimpleNamespace(model="stub")
+        self.output_key = output_key
+        self.metadata = {"prompt_digest": output_key}
+        self.respond = respond
+        self.delay = delay
+        self.active = 0
+        self.peak = 0
+
+    async def ainvoke(self, inputs):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            await asyncio.sleep(self.delay(inputs))
+            return {self.output_key: self.respond(inputs)}
+        finally:
+            self.active -= 1
+
+
+def stub_handler(extraction_delay=lambda inputs: 0.01):
+    """A handler whose chains are all stubs; each document's company name is the document itself."""
+    handler = LangChainHandler()
+    handler.extraction_chain = handler.short_extraction_chain = StubChain(
+        "extracted_data",
+        lambda inputs: orjson.dumps({"company_name": inputs["document_content"]}).decode(),
+        extraction_delay
+    )
+    handler.overview_chain = StubChain("business_overview", lambda inputs: "overview")
+    handler.combined_chain = StubChain("combined", lambda inputs: '{"key_findings": "findings"}')
+    return handler
+
+
+def test_sync_wrappers_reuse_handler_across_event_loops():
+    handler = stub_handler()
+    # More documents than LLM slots, so the handler's limits are contended in both loops
+    for run in range(2):
+        documents = [f"loop test {run} document {i}" for i in range(8)]
+        results = asyncio.run(handler.analyze_documents_batch(documents))
+        assert [result.get("error") for result in results] == [None] * len(documents)
+    assert "error" not in handler.analyze_financial_document("loop test sync document")
+
+
+def test_analyze_documents_batch_keeps_input_order_and_concurrency_limit():
+    documents = [f"batch test document {i}" for i in range(9)]
+    # Later documents finish first, so gather order rather than completion order is what's returned
+    handler = stub_handler(lambda inputs: 0.05 - 0.005 * documents.index(inputs["document_content"]))
+    results = asyncio.run(handler.analyze_documents_batch(documents, max_concurrency=3))
+    assert [result["extracted_data"]["company_name"] for result in results] == documents
+    assert handler.extraction_chain.peak == 3
+
+
+def test_full_and_short_extraction_chains_have_separate_cache_keys():
+    handler = LangChainHandler()
+    inputs = {"document_content": "Revenue 100"}
+    assert (response_cache_key(handler.extraction_chain, inputs)
+            != response_cache_key(handler.short_extraction_chain, inputs))